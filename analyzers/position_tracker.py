@@ -3,6 +3,7 @@
 管理买入信号后的持仓状态，实现动态止损
 """
 
+import atexit
 import json
 import os
 from datetime import datetime
@@ -11,10 +12,19 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# 增量日志累计多少条后合并为一次完整快照
+SNAPSHOT_EVERY = 100
+
 
 class Position:
     """单个持仓"""
     
+    # 固定字段布局，省去实例 __dict__；顺序即 to_dict 的字段顺序
+    __slots__ = (
+        'coin', 'entry_price', 'amount', 'entry_date', 'signal_reasons',
+        'max_price', 'current_price', 'status', 'stop_triggered_at', 'stop_price',
+    )
+    
     def __init__(self, coin: str, entry_price: float, entry_date: str, signal_reasons: List[str] = None, amount: float = 1.0):
         self.coin = coin
         self.entry_price = entry_price
@@ -56,18 +66,7 @@ class Position:
         return (self.current_price - self.max_price) / self.max_price * 100
     
     def to_dict(self) -> dict:
-        return {
-            'coin': self.coin,
-            'entry_price': self.entry_price,
-            'amount': self.amount,
-            'entry_date': self.entry_date,
-            'signal_reasons': self.signal_reasons,
-            'max_price': self.max_price,
-            'current_price': self.current_price,
-            'status': self.status,
-            'stop_triggered_at': self.stop_triggered_at,
-            'stop_price': self.stop_price,
-        }
+        return {name: getattr(self, name) for name in self.__slots__}
     
     @classmethod
     def from_dict(cls, data: dict) -> 'Position':
@@ -100,41 +99,122 @@ class PositionTracker:
         self.stop_pct = risk_config.get('stop_loss_pct', -15)
         self.initial_stop = risk_config.get('initial_stop', -20)
         self.notify_on_stop = risk_config.get('notify_on_stop', True)
+        # 止损线 = 基准价 * 系数，配置不变时系数只算一次
+        self._trailing_frac = 1 + self.stop_pct / 100
+        self._fixed_frac = 1 + self.initial_stop / 100
+        # 止损类型在运行期不变，构造时绑定对应的检查与止损线实现
+        if self.stop_type == 'trailing':
+            self._check_stop_loss = self._check_trailing_stop
+            self._stop_line = self._trailing_stop_line
+        else:
+            self._check_stop_loss = self._check_fixed_stop
+            self._stop_line = self._fixed_stop_line
+        
+        # 自上次快照以来写入增量日志的条数
+        self._dirty = 0
         
         # 加载持仓
         self._load_positions()
+        # 退出时把增量日志合并为快照
+        atexit.register(self._flush_positions)
     
     def _get_positions_file(self) -> str:
         return os.path.join(os.path.dirname(__file__), '..', '.positions.json')
     
+    def _get_log_file(self) -> str:
+        return os.path.splitext(self._get_positions_file())[0] + '.log'
+    
     def _load_positions(self):
-        """从文件加载持仓"""
+        """从快照加载持仓，并回放快照之后的增量日志"""
         path = self._get_positions_file()
+        loaded: Dict[str, Position] = {}
         if os.path.exists(path):
             try:
-                with open(path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    for pos_data in data.get('positions', []):
-                        pos = Position.from_dict(pos_data)
-                        if pos.status == 'open':
-                            self.positions[pos.coin] = pos
-                logger.info(f"📂 加载 {len(self.positions)} 个持仓")
+                with open(path, 'rb') as f:
+                    data = json.loads(f.read())
+                for pos_data in data.get('positions', []):
+                    pos = Position.from_dict(pos_data)
+                    loaded[pos.coin] = pos
             except Exception as e:
                 logger.warning(f"加载持仓失败: {e}")
+        
+        log_path = self._get_log_file()
+        torn = False
+        if os.path.exists(log_path):
+            try:
+                with open(log_path, 'rb') as f:
+                    for line in f:
+                        try:
+                            event = json.loads(line)
+                        except ValueError:
+                            # 进程中断时可能留下半行，跳过
+                            torn = True
+                            continue
+                        if event.get('op') == 'remove':
+                            loaded.pop(event.get('coin'), None)
+                        elif event.get('op') == 'upsert':
+                            pos = Position.from_dict(event['position'])
+                            loaded[pos.coin] = pos
+                        self._dirty += 1
+            except Exception as e:
+                logger.warning(f"回放持仓日志失败: {e}")
+        
+        for coin, pos in loaded.items():
+            if pos.status == 'open':
+                self.positions[coin] = pos
+        if loaded:
+            logger.info(f"📂 加载 {len(self.positions)} 个持仓")
+        if torn:
+            # 立即合并，避免后续追加的记录接在半行后面
+            self._save_positions()
     
     def _save_positions(self):
-        """保存持仓到文件"""
+        """写入完整快照（原子替换），并清空增量日志"""
         path = self._get_positions_file()
+        tmp_path = path + '.tmp'
         try:
             data = {
                 'updated_at': datetime.now().isoformat(),
                 'positions': [p.to_dict() for p in self.positions.values()]
             }
-            with open(path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            with open(tmp_path, 'wb') as f:
+                f.write(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+            os.replace(tmp_path, path)
+            # 快照已包含日志中的全部变更
+            log_path = self._get_log_file()
+            if os.path.exists(log_path):
+                os.remove(log_path)
+            self._dirty = 0
         except Exception as e:
             logger.warning(f"保存持仓失败: {e}")
     
+    def _save_positions_incremental(self, events: List[dict]):
+        """
+        追加增量日志，累计达到 SNAPSHOT_EVERY 条后合并为快照
+        :param events: {'op': 'upsert', 'position': {...}} 或 {'op': 'remove', 'coin': ...}
+        """
+        if not events:
+            return
+        try:
+            with open(self._get_log_file(), 'ab') as f:
+                f.write(''.join(
+                    json.dumps(e, ensure_ascii=False, separators=(',', ':')) + '\n'
+                    for e in events
+                ).encode('utf-8'))
+            self._dirty += len(events)
+        except Exception as e:
+            logger.warning(f"写入持仓日志失败: {e}")
+            # 日志写不进去时退回完整快照
+            self._save_positions()
+            return
+        if self._dirty >= SNAPSHOT_EVERY:
+            self._save_positions()
+    
+    def _flush_positions(self):
+        """有未合并的增量日志时写入快照"""
+        if self._dirty:
+            self._save_positions()
+    
     def add_position(self, coin: str, price: float, reasons: List[str] = None, amount: float = 1.0):
         """添加或更新持仓 (支持加仓)"""
         if coin in self.positions:
@@ -142,11 +222,10 @@ class PositionTracker:
             old_price = pos.entry_price
             pos.add_amount(price, amount)
             if reasons:
-                pos.signal_reasons.extend(reasons)
-                # 去重
-                pos.signal_reasons = list(set(pos.signal_reasons))
+                # 去重并保留原有顺序
+                pos.signal_reasons = list(dict.fromkeys(pos.signal_reasons + reasons))
                 
-            self._save_positions()
+            self._save_positions_incremental([{'op': 'upsert', 'position': pos.to_dict()}])
             logger.info(f"➕ {coin} 加仓: ${price:.2f} (新均价: ${pos.entry_price:.2f})")
             return
         
@@ -158,7 +237,7 @@ class PositionTracker:
             amount=amount
         )
         self.positions[coin] = pos
-        self._save_positions()
+        self._save_positions_incremental([{'op': 'upsert', 'position': pos.to_dict()}])
         logger.info(f"📥 建仓: {coin} @ ${price:.2f}")
     
     def update_prices(self, prices: Dict[str, float]) -> Dict:
@@ -169,19 +248,25 @@ class PositionTracker:
         stopped = []
         new_highs = []
         stop_line_raised = []
+        updated = []
+        # 固定止损线只依赖买入价，更新价格不会使其上移
+        trailing = self.stop_type == 'trailing'
+        trailing_frac = self._trailing_frac
+        # 同一批价格共用一个止损时间戳
+        now_iso = datetime.now().isoformat()
         
-        for coin, price in prices.items():
-            if coin not in self.positions:
+        # 持仓数通常远少于行情币种数，只遍历持仓
+        for coin, pos in self.positions.items():
+            if coin not in prices:
                 continue
             
-            pos = self.positions[coin]
+            price = prices[coin]
+            updated.append(pos)
             old_max = pos.max_price
-            old_stop_line = self.get_stop_line(coin)
             
             pos.update_price(price)
             
             new_max = pos.max_price
-            new_stop_line = self.get_stop_line(coin)
             
             # 检测新高突破 (首次超过旧最高价)
             if new_max > old_max and old_max == pos.entry_price:
@@ -195,6 +280,11 @@ class PositionTracker:
                 logger.info(f"🚀 {coin} 创新高: ${new_max:.2f} (+{pos.get_return_pct():.1f}%)")
             
             # 检测止损线上移 (涨幅>2%导致止损线上移)
+            if trailing and new_max > old_max:
+                old_stop_line = old_max * trailing_frac
+                new_stop_line = new_max * trailing_frac
+            else:
+                old_stop_line = new_stop_line = None
             if old_stop_line and new_stop_line and new_stop_line > old_stop_line:
                 raise_pct = (new_stop_line - old_stop_line) / old_stop_line * 100
                 if raise_pct >= 2.0:  # 止损线上移超过2%才通知
@@ -211,7 +301,7 @@ class PositionTracker:
             stop_triggered = self._check_stop_loss(pos)
             if stop_triggered:
                 pos.status = 'stopped'
-                pos.stop_triggered_at = datetime.now().isoformat()
+                pos.stop_triggered_at = now_iso
                 pos.stop_price = price
                 
                 stopped.append({
@@ -225,26 +315,26 @@ class PositionTracker:
                 
                 logger.warning(f"🛑 {coin} 触发止损: ${pos.entry_price:.2f} -> ${price:.2f} ({pos.get_return_pct():+.1f}%)")
         
-        self._save_positions()
+        self._save_positions_incremental([{'op': 'upsert', 'position': p.to_dict()} for p in updated])
         return {
             'stopped': stopped,
             'new_highs': new_highs,
             'stop_line_raised': stop_line_raised,
         }
     
-    def _check_stop_loss(self, pos: Position) -> bool:
-        """检查是否触发止损"""
-        if pos.status != 'open':
-            return False
-        
-        if self.stop_type == 'trailing':
-            # 动态止损：从最高价回撤
-            drawdown = pos.get_drawdown_from_max()
-            return drawdown <= self.stop_pct
-        else:
-            # 固定止损：从买入价
-            ret = pos.get_return_pct()
-            return ret <= self.initial_stop
+    def _check_trailing_stop(self, pos: Position) -> bool:
+        """动态止损：从最高价回撤"""
+        return pos.status == 'open' and pos.get_drawdown_from_max() <= self.stop_pct
+    
+    def _check_fixed_stop(self, pos: Position) -> bool:
+        """固定止损：从买入价"""
+        return pos.status == 'open' and pos.get_return_pct() <= self.initial_stop
+    
+    def _trailing_stop_line(self, pos: Position) -> float:
+        return pos.max_price * self._trailing_frac
+    
+    def _fixed_stop_line(self, pos: Position) -> float:
+        return pos.entry_price * self._fixed_frac
     
     def get_position(self, coin: str) -> Optional[dict]:
         """获取特定币种的持仓信息"""
@@ -257,30 +347,28 @@ class PositionTracker:
         if coin not in self.positions:
             return None
         
-        pos = self.positions[coin]
-        if self.stop_type == 'trailing':
-            return pos.max_price * (1 + self.stop_pct / 100)
-        else:
-            return pos.entry_price * (1 + self.initial_stop / 100)
+        return self._stop_line(self.positions[coin])
     
     def get_status(self) -> Dict:
         """获取持仓状态摘要"""
         total_return = 0
-        for pos in self.positions.values():
+        open_positions = {}
+        for coin, pos in self.positions.items():
             if pos.status == 'open':
                 total_return += pos.get_return_pct()
+                open_positions[coin] = pos.to_dict()
         
         return {
-            'open_positions': len([p for p in self.positions.values() if p.status == 'open']),
+            'open_positions': len(open_positions),
             'total_return_pct': round(total_return, 2),
-            'positions': {k: v.to_dict() for k, v in self.positions.items() if v.status == 'open'}
+            'positions': open_positions
         }
     
     def remove_position(self, coin: str):
         """移除持仓（手动平仓）"""
         if coin in self.positions:
             del self.positions[coin]
-            self._save_positions()
+            self._save_positions_incremental([{'op': 'remove', 'coin': coin}])
             logger.info(f"📤 移除持仓: {coin}")
 
     def sync_positions(self, exchange_positions: List[Dict]):
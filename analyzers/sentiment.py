@@ -3,11 +3,12 @@
 负责获取和分析市场情绪指标
 """
 
-import requests
 import time
 from typing import Optional, Dict
 import logging
 
+from utils.helpers import create_http_session, DEFAULT_TIMEOUT
+
 logger = logging.getLogger(__name__)
 
 class SentimentAnalyzer:
@@ -16,7 +17,7 @@ class SentimentAnalyzer:
     def __init__(self, config: dict, db):
         self.config = config
         self.db = db
-        self.session = requests.Session()
+        self.session = create_http_session()
     
     def get_fear_greed_index(self, max_retries=3) -> Optional[Dict]:
         """
@@ -26,8 +27,9 @@ class SentimentAnalyzer:
         url = "https://api.alternative.me/fng/?limit=1"
         for attempt in range(max_retries):
             try:
-                response = self.session.get(url, timeout=30).json()
-                data = response['data'][0]
+                response = self.session.get(url, timeout=DEFAULT_TIMEOUT)
+                response.raise_for_status()
+                data = response.json()['data'][0]
                 return {
                     'value': int(data['value']),
                     'classification': data['value_classification'],
@@ -74,35 +76,35 @@ class SentimentAnalyzer:
                 analysis['overall_sentiment'] = 'neutral'
                 analysis['fear_greed_status'] = 'hold'
         
-        # 资金费率分析
+        # 资金费率 / 多空比分析 (单次遍历所有币种)
+        funding_status = analysis['funding_status']
+        longshort_status = analysis['longshort_status']
         for coin, coin_data in data.get('coins', {}).items():
             funding = coin_data.get('funding_rate')
             if funding is not None:
                 if funding < -0.02:
-                    analysis['funding_status'][coin] = 'extreme_negative'
+                    funding_status[coin] = 'extreme_negative'
                 elif funding < 0:
-                    analysis['funding_status'][coin] = 'negative'
+                    funding_status[coin] = 'negative'
                 elif funding > 0.05:
-                    analysis['funding_status'][coin] = 'extreme_positive'
+                    funding_status[coin] = 'extreme_positive'
                 elif funding > 0.02:
-                    analysis['funding_status'][coin] = 'positive'
+                    funding_status[coin] = 'positive'
                 else:
-                    analysis['funding_status'][coin] = 'neutral'
-        
-        # 多空比分析
-        for coin, coin_data in data.get('coins', {}).items():
+                    funding_status[coin] = 'neutral'
+            
             ls = coin_data.get('longshort')
             if ls:
                 ratio = ls.get('ratio', 1)
                 if ratio < 0.7:
-                    analysis['longshort_status'][coin] = 'extreme_short'
+                    longshort_status[coin] = 'extreme_short'
                 elif ratio < 0.9:
-                    analysis['longshort_status'][coin] = 'short_dominated'
+                    longshort_status[coin] = 'short_dominated'
                 elif ratio > 1.5:
-                    analysis['longshort_status'][coin] = 'extreme_long'
+                    longshort_status[coin] = 'extreme_long'
                 elif ratio > 1.2:
-                    analysis['longshort_status'][coin] = 'long_dominated'
+                    longshort_status[coin] = 'long_dominated'
                 else:
-                    analysis['longshort_status'][coin] = 'balanced'
+                    longshort_status[coin] = 'balanced'
         
         return analysis
\ No newline at end of file
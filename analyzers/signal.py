@@ -4,16 +4,82 @@
 支持两种策略模式: fear_buy (恐慌买入) 和 trend (趋势跟随)
 """
 
-from typing import Dict, List, Optional
+from typing import Deque, Dict, List, Optional, Tuple
+import bisect
 import logging
-from datetime import datetime, timezone
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from enum import IntEnum
 from .trend import TechnicalAnalysis
 
 logger = logging.getLogger(__name__)
 
+# 拐点检测的恐慌区上界 / 贪婪区下界
+REVERSAL_FEAR_ZONE = 30
+REVERSAL_GREED_ZONE = 70
+
+
+class Strength(IntEnum):
+    """信号强度 (内部比较用整数，输出时转为中文标签)"""
+    WEAK = 0
+    MEDIUM = 1
+    STRONG = 2
+    EXTREME = 3
+    
+    @property
+    def label(self) -> str:
+        return _STRENGTH_LABELS[self]
+
+
+_STRENGTH_LABELS = {
+    Strength.WEAK: "弱",
+    Strength.MEDIUM: "中等",
+    Strength.STRONG: "强",
+    Strength.EXTREME: "极强",
+}
+
+# 共振升级一档后的强度 (最高为极强)
+_UPGRADED_STRENGTH = {s: Strength(min(s + 1, Strength.EXTREME)) for s in Strength}
+
+class _FundingWindow:
+    """单个币种的资金费率滑动窗口：按时间顺序保存原始记录，同时维护升序视图"""
+    
+    __slots__ = ('loaded_at', 'entries', 'sorted_rates')
+    
+    def __init__(self, entries: List[Tuple[float, float]], loaded_at: float):
+        self.loaded_at = loaded_at
+        self.entries: Deque[Tuple[float, float]] = deque(entries)
+        self.sorted_rates: List[float] = sorted(rate for _, rate in entries)
+    
+    def add(self, timestamp: float, rate: float):
+        """追加新费率，有序视图插入即可，无需重新排序"""
+        self.entries.append((timestamp, rate))
+        bisect.insort(self.sorted_rates, rate)
+    
+    def evict_before(self, start_ts: float):
+        """移出窗口起点之前的记录"""
+        entries = self.entries
+        sorted_rates = self.sorted_rates
+        while entries and entries[0][0] < start_ts:
+            _, rate = entries.popleft()
+            del sorted_rates[bisect.bisect_left(sorted_rates, rate)]
+
+
 class SignalGenerator:
     """信号生成器"""
     
+    __slots__ = (
+        'config', 'db', 'exchange', 'thresholds', 'reversal_config', 'resonance_config',
+        'strategy_config', 'windows_config',
+        '_fear_buy', '_greed_sell', '_funding_panic_pct', '_funding_greed_pct', '_ls_extreme',
+        '_use_reversal', '_use_funding_pct', '_use_longshort', '_use_sell_signal',
+        '_reversal_hours', '_funding_hours', '_funding_cache', '_funding_cache_ttl',
+        '_fg_history', '_required_periods', '_fg_history_maxlen',
+        '_pool', 'strategy_mode', 'trend_analyzer',
+    )
+    
     def __init__(self, config: dict, db, exchange=None):
         self.config = config
         self.db = db
@@ -25,6 +91,36 @@ class SignalGenerator:
         self.strategy_config = config.get('strategy', {})
         self.windows_config = config.get('windows', {})
         
+        # 逐币种判断时使用的阈值与开关，配置在运行期不变，构造时读取一次
+        self._fear_buy = self.thresholds.get('fear_buy')
+        self._greed_sell = self.thresholds.get('greed_sell')
+        self._funding_panic_pct = self.thresholds.get('funding_panic_percentile')
+        self._funding_greed_pct = self.thresholds.get('funding_greed_percentile')
+        self._ls_extreme = self.thresholds.get('longshort_extreme')
+        self._use_reversal = bool(self.strategy_config.get('use_reversal', True) and self.reversal_config['enabled'])
+        self._use_funding_pct = bool(self.strategy_config.get('use_funding_percentile', True))
+        self._use_longshort = bool(self.strategy_config.get('use_longshort', True))
+        self._use_sell_signal = bool(self.strategy_config.get('use_sell_signal', True))
+        self._reversal_hours = self.windows_config.get('reversal_history_hours', 72)
+        self._funding_hours = self.windows_config.get('funding_history_hours', 168)
+        
+        # 资金费率历史窗口: coin -> _FundingWindow，定期从数据库重建，其间由 record_funding 追加
+        self._funding_cache: Dict[str, _FundingWindow] = {}
+        self._funding_cache_ttl = self.windows_config.get('funding_cache_seconds', 3600)
+        
+        # 恐慌指数近期序列 (时间戳, 数值)，首次检查拐点时从数据库预热，之后由 record_fear_greed 追加
+        # 拐点只看最近 consecutive_periods 个点，保留少量余量即可
+        self._fg_history: Optional[Deque[Tuple[float, int]]] = None
+        self._required_periods = max(1, self.reversal_config.get('consecutive_periods', 2))
+        self._fg_history_maxlen = max(16, self._required_periods + 4)
+        
+        # 各币种信号互不依赖，数据库/网络读取可并行
+        enabled_coins = [c for c in config.get('coins', []) if c.get('enabled', True)]
+        self._pool = ThreadPoolExecutor(
+            max_workers=min(8, max(1, len(enabled_coins))),
+            thread_name_prefix='signal'
+        )
+        
         # 策略模式: "trend" (推荐) 或 "fear_buy"
         self.strategy_mode = self.strategy_config.get('mode', 'fear_buy')
         
@@ -54,23 +150,28 @@ class SignalGenerator:
         
         fg_value = data['fear_greed']['value']
         
-        # 为每个启用的币种生成信号
-        for coin_symbol, coin_data in data.get('coins', {}).items():
-            if not coin_data.get('price'):
-                continue
-            
-            ts_val = data.get('timestamp')
-            
-            current_ts = ts_val.timestamp() if hasattr(ts_val, 'timestamp') else None
-            
-            signal = self._generate_coin_signal(
-                coin_symbol, 
-                coin_data, 
-                fg_value, 
+        # 拐点序列是所有币种共享的，在分发到线程池之前完成预热
+        if self._fg_history is None and self._use_reversal:
+            self._prime_fg_history(self._reversal_hours)
+        
+        ts_val = data.get('timestamp')
+        current_ts = ts_val.timestamp() if hasattr(ts_val, 'timestamp') else None
+        
+        # 为每个启用的币种生成信号 (并行执行，按币种原始顺序收集结果)
+        futures = [
+            self._pool.submit(
+                self._generate_coin_signal,
+                coin_symbol,
+                coin_data,
+                fg_value,
                 data,
                 current_ts
             )
-            
+            for coin_symbol, coin_data in data.get('coins', {}).items()
+            if coin_data.get('price')
+        ]
+        for future in futures:
+            signal = future.result()
             if signal:
                 signals.append(signal)
         
@@ -81,13 +182,23 @@ class SignalGenerator:
             
             if resonance_count >= min_coins:
                 logger.info(f"检测到{resonance_count}个币种共振")
+                reason = f"市场共振({resonance_count}个币种)"
                 for signal in signals:
                     signal['tags'].append('#共振')
-                    signal['strength'] = self._upgrade_strength(signal['strength'])
-                    signal['reasons'].append(f"市场共振({resonance_count}个币种)")
+                    signal['strength'] = _UPGRADED_STRENGTH[signal['strength']]
+                    signal['reasons'].append(reason)
+        
+        # 强度对外仍为中文标签 (通知 / 数据库)
+        for signal in signals:
+            signal['strength'] = signal['strength'].label
         
         return signals
     
+    def close(self):
+        """关闭信号生成线程池，等待进行中的任务完成"""
+        self._pool.shutdown(wait=True)
+        logger.info("信号线程池已关闭")
+    
     def _generate_coin_signal(
         self, 
         coin: str, 
@@ -105,12 +216,12 @@ class SignalGenerator:
             return self._generate_trend_signal(coin, coin_data, fg_value, full_data)
         
         # 恐慌买入策略模式 (旧逻辑)
-        if fg_value < self.thresholds['fear_buy']:
+        if fg_value < self._fear_buy:
             return self._generate_buy_signal(coin, coin_data, fg_value, full_data, current_timestamp)
         
         # 卖出信号（可通过配置禁用）
-        elif fg_value > self.thresholds['greed_sell']:
-            if self.strategy_config.get('use_sell_signal', True):
+        elif fg_value > self._greed_sell:
+            if self._use_sell_signal:
                 return self._generate_sell_signal(coin, coin_data, fg_value, full_data, current_timestamp)
         
         return None
@@ -134,17 +245,17 @@ class SignalGenerator:
         if not result['valid']:
             return None
         
-        strength = "强" if result['quality'] == 'high' else "中等"
+        strength = Strength.STRONG if result['quality'] == 'high' else Strength.MEDIUM
         tags = ["#趋势", "#金叉"] if result['score'] >= 6 else ["#趋势"]
         
         # 添加资金费率信息
-        if self.strategy_config.get('use_funding_percentile', True):
+        if self._use_funding_pct:
             funding = coin_data.get('funding_rate')
             if funding is not None:
                 funding_pct = self._calculate_funding_percentile(coin, funding)
-                if funding_pct and funding_pct < self.thresholds['funding_panic_percentile']:
+                if funding_pct and funding_pct < self._funding_panic_pct:
                     result['reasons'].append(f"资金费率: {funding_pct:.1f}%分位")
-                    strength = "极强"
+                    strength = Strength.EXTREME
                     tags.append("#资金恐慌")
         
         return {
@@ -165,42 +276,42 @@ class SignalGenerator:
     ) -> Optional[Dict]:
         """生成买入信号"""
         
-        strength = "弱"
+        strength = Strength.WEAK
         reasons = [f"恐慌指数: {fg_value}"]
         tags = ["#观察"]
         is_reversal = False
         
         # 检查拐点
-        if self.strategy_config.get('use_reversal', True) and self.reversal_config['enabled']:
+        if self._use_reversal:
             is_reversal = self._check_reversal(fg_value, current_timestamp)
             if is_reversal:
-                strength = "中等"
+                strength = Strength.MEDIUM
                 reasons.append("✅ 恐慌拐点确认")
                 tags = ["#拐点确认"]
         
         # 检查资金费率分位数
-        if self.strategy_config.get('use_funding_percentile', True):
+        if self._use_funding_pct:
             funding = coin_data.get('funding_rate')
             if funding is not None:
                 funding_pct = self._calculate_funding_percentile(coin, funding)
                 
-                if funding_pct and funding_pct < self.thresholds['funding_panic_percentile']:
-                    strength = "强"
+                if funding_pct and funding_pct < self._funding_panic_pct:
+                    strength = Strength.STRONG
                     reasons.append(f"资金费率分位: {funding_pct:.1f}% (极端恐慌)")
                     tags = ["#抄底"]
         
         # 检查多空比
-        if self.strategy_config.get('use_longshort', True):
+        if self._use_longshort:
             ls = coin_data.get('longshort')
             if ls:
                 ratio = ls.get('ratio', 1)
-                if ratio < self.thresholds['longshort_extreme']:
+                if ratio < self._ls_extreme:
                     reasons.append(f"多空比: {ratio} (空头主导)")
-                    if strength == "强":
-                        strength = "极强"
+                    if strength == Strength.STRONG:
+                        strength = Strength.EXTREME
         
         # 只在有强信号时才发出
-        if strength in ["中等", "强", "极强"] or is_reversal:
+        if strength >= Strength.MEDIUM or is_reversal:
             return {
                 'coin': coin,
                 'type': 'BUY',
@@ -221,33 +332,33 @@ class SignalGenerator:
     ) -> Optional[Dict]:
         """生成卖出信号"""
         
-        strength = "弱"
+        strength = Strength.WEAK
         reasons = [f"贪婪指数: {fg_value}"]
         tags = ["#观察"]
         is_reversal = False
         funding_pct = None
         
         # 检查拐点
-        if self.strategy_config.get('use_reversal', True) and self.reversal_config['enabled']:
+        if self._use_reversal:
             is_reversal = self._check_reversal(fg_value, current_timestamp)
             if is_reversal:
-                strength = "中等"
+                strength = Strength.MEDIUM
                 reasons.append("✅ 贪婪拐点确认")
                 tags = ["#拐点确认", "#派发区"]
         
         # 检查资金费率
-        if self.strategy_config.get('use_funding_percentile', True):
+        if self._use_funding_pct:
             funding = coin_data.get('funding_rate')
             if funding is not None:
                 funding_pct = self._calculate_funding_percentile(coin, funding)
                 
-                if funding_pct and funding_pct > self.thresholds['funding_greed_percentile']:
-                    strength = "强"
+                if funding_pct and funding_pct > self._funding_greed_pct:
+                    strength = Strength.STRONG
                     reasons.append(f"资金费率分位: {funding_pct:.1f}% (过热)")
                     tags = ["#派发区", "#过热"]
         
         # 只在有强信号时才发出（与买入逻辑对称）
-        if strength in ["中等", "强", "极强"] or is_reversal:
+        if strength >= Strength.MEDIUM or is_reversal:
             return {
                 'coin': coin,
                 'type': 'SELL',
@@ -263,111 +374,36 @@ class SignalGenerator:
         检查情绪拐点
         需要连续N次反转确认
         """
-        if not self.reversal_config['enabled']:
+        if not self._use_reversal:
             return False
 
         try:
-            # 获取历史恐慌指数
-            # Use configured history window or default to 72 hours
-            history_hours = self.windows_config.get('reversal_history_hours', 72)
-            full_history = self.db.get_fear_greed_history(hours=history_hours)
+            history_hours = self._reversal_hours
+            if self._fg_history is None:
+                self._prime_fg_history(history_hours)
             
-            # 过滤掉当前的数据点
-            history = []
+            start_ts = int(datetime.now().timestamp()) - (history_hours * 3600)
             if current_timestamp:
-                values = []
-                for item in full_history:
-                    # 处理时间戳兼容性
-                    try:
-                        ts_val = item['timestamp']
-                        if isinstance(ts_val, str):
-                            # 修复：SQLite CURRENT_TIMESTAMP 格式为空格分隔，需转换为 ISO 格式
-                            time_str = ts_val.replace(' ', 'T')
-                            dt = datetime.fromisoformat(time_str)
-                            if dt.tzinfo is None:
-                                dt = dt.replace(tzinfo=timezone.utc)
-                            ts = dt.timestamp()
-                        else:
-                            ts = float(ts_val)
-                        
-                        # 只有当记录时间早于当前时间(容差5秒)才算历史
-                        if ts < current_timestamp - 5:
-                            values.append(item['value'])
-                    except Exception as e:
-                        # 时间戳解析失败时，跳过该数据点
-                        continue
-                history = values
+                # 只有当记录时间早于当前时间(容差5秒)才算历史
+                cutoff = current_timestamp - 5
+                history = [v for ts, v in self._fg_history if start_ts <= ts < cutoff]
             else:
                 # 兼容旧逻辑
-                history = [item['value'] for item in full_history]
+                history = [v for ts, v in self._fg_history if ts >= start_ts]
 
             # N次反转需要至少N个数据变化，即N+1个数据点
             # 由于我们使用history[-1]作为起始点，所以至少需要required_periods个历史数据
-            required_periods = self.reversal_config.get('consecutive_periods', 2)
+            required_periods = self._required_periods
             if len(history) < required_periods:
                 return False
 
-            # 恐慌反转：连续上升（从恐慌转向贪婪）
-            if current_fg < 30:
-                # 确保最新的历史数据也在恐慌区域
-                if history[-1] >= 30:
-                    return False
+            # 恐慌反转：最近N个历史点都在恐慌区且连续上升，当前值继续上升
+            if current_fg < REVERSAL_FEAR_ZONE:
+                return self._is_monotone_tail(history[-required_periods:], current_fg, 1, REVERSAL_FEAR_ZONE)
 
-                # 检查是否有required_periods次连续上升
-                # 序列：history[-required_periods] -> ... -> history[-2] -> history[-1] -> current_fg
-                # 或者：history[-required_periods+1] -> ... -> history[-1] -> current_fg （如果刚好够）
-
-                # 获取要检查的历史数据范围
-                check_range = required_periods  # 需要检查的历史数据点数
-                if len(history) < check_range:
-                    return False
-
-                start_idx = len(history) - check_range
-                for i in range(start_idx, len(history)):
-                    # 检查所有历史数据是否都在恐慌区域
-                    if history[i] >= 30:
-                        return False
-
-                # 检查连续上升
-                # 从 start_idx 到 len(history)-1 检查历史数据中的连续上升
-                for i in range(start_idx + 1, len(history)):
-                    if history[i] <= history[i-1]:
-                        return False  # 没有上升
-
-                # 检查当前值是否继续上升
-                if current_fg <= history[-1]:
-                    return False  # 当前值没有上升
-
-                return True  # 所有的上升检查都通过了
-
-            # 贪婪反转：连续下降（从贪婪转向恐慌）
-            if current_fg > 70:
-                # 确保最新的历史数据也在贪婪区域
-                if history[-1] <= 70:
-                    return False
-
-                # 检查是否有required_periods次连续下降
-                check_range = required_periods
-                if len(history) < check_range:
-                    return False
-
-                start_idx = len(history) - check_range
-                for i in range(start_idx, len(history)):
-                    # 检查所有历史数据是否都在贪婪区域
-                    if history[i] <= 70:
-                        return False
-
-                # 检查连续下降
-                # 从 start_idx 到 len(history)-1 检查历史数据中的连续下降
-                for i in range(start_idx + 1, len(history)):
-                    if history[i] >= history[i-1]:
-                        return False  # 没有下降
-
-                # 检查当前值是否继续下降
-                if current_fg >= history[-1]:
-                    return False  # 当前值没有下降
-
-                return True  # 所有的下降检查都通过了
+            # 贪婪反转：最近N个历史点都在贪婪区且连续下降，当前值继续下降
+            if current_fg > REVERSAL_GREED_ZONE:
+                return self._is_monotone_tail(history[-required_periods:], current_fg, -1, REVERSAL_GREED_ZONE)
 
             return False
 
@@ -375,19 +411,66 @@ class SignalGenerator:
             logger.error(f"检查拐点失败: {e}")
             return False
     
+    @staticmethod
+    def _is_monotone_tail(tail: List[int], current: int, direction: int, zone_bound: int) -> bool:
+        """
+        单次遍历检查序列尾部是否严格单调并始终处于区间内
+        :param tail: 最近的历史值 (按时间顺序)
+        :param current: 当前值，需沿同一方向继续变化
+        :param direction: 1 = 连续上升 (恐慌区在边界之下)，-1 = 连续下降 (贪婪区在边界之上)
+        :param zone_bound: 区间边界，历史值不得触及
+        :return: 是否满足拐点条件
+        """
+        prev = None
+        for v in tail:
+            if (v - zone_bound) * direction >= 0:
+                return False  # 离开恐慌/贪婪区
+            if prev is not None and (v - prev) * direction <= 0:
+                return False  # 没有按方向变化
+            prev = v
+        return (current - prev) * direction > 0
+    
+    def record_fear_greed(self, timestamp: float, value: int):
+        """
+        记录新入库的恐慌指数，拐点检查无需再查询数据库
+        :param timestamp: 入库时间戳
+        :param value: 恐慌指数
+        """
+        if self._fg_history is not None:
+            self._fg_history.append((timestamp, value))
+    
+    def _prime_fg_history(self, hours: int):
+        """从数据库加载恐慌指数历史，初始化近期序列"""
+        # 序列只保留最近 maxlen 条，只需查询尾部；数据库层已保证时间戳为整数秒
+        tail = self.db.get_fear_greed_tail(self._fg_history_maxlen, hours=hours)
+        self._fg_history = deque(
+            ((item['timestamp'], item['value']) for item in tail),
+            maxlen=self._fg_history_maxlen
+        )
+    
+    def record_funding(self, timestamp: float, coins: Dict[str, Dict]):
+        """
+        记录新入库的资金费率，已缓存的币种增量更新有序窗口
+        :param timestamp: 入库时间戳
+        :param coins: 市场数据中的 coins 字典
+        """
+        for coin, window in self._funding_cache.items():
+            funding = coins.get(coin, {}).get('funding_rate')
+            if funding is not None:
+                window.add(timestamp, funding)
+    
     def _calculate_funding_percentile(self, coin: str, current_rate: float) -> Optional[float]:
         """
         计算资金费率在历史中的分位数
         """
         try:
-            # Use configured history window or default to 168 hours (7 days)
-            history_hours = self.windows_config.get('funding_history_hours', 168)
-            history = self.db.get_funding_history(coin, hours=history_hours)
+            history = self._get_sorted_funding_history(coin)
             
             if len(history) < 24:  # 至少1天数据
                 return None
             
-            lower_count = sum(1 for x in history if x < current_rate)
+            # 有序序列上二分即可得到严格小于当前费率的个数
+            lower_count = bisect.bisect_left(history, current_rate)
             percentile = (lower_count / len(history)) * 100
             
             return round(percentile, 1)
@@ -396,12 +479,20 @@ class SignalGenerator:
             logger.error(f"计算分位数失败: {e}")
             return None
     
-    def _upgrade_strength(self, strength: str) -> str:
-        """升级信号强度"""
-        if "弱" in strength:
-            return "中等"
-        elif "中等" in strength:
-            return "强"
-        elif "强" in strength and "极" not in strength:
-            return "极强"
-        return strength
\ No newline at end of file
+    def _get_sorted_funding_history(self, coin: str) -> List[float]:
+        """
+        获取窗口内升序排列的资金费率
+        缓存有效期内只做增量维护 (record_funding 追加、此处移出过期记录)，过期后从数据库重建
+        :param coin: 币种符号
+        :return: 升序费率列表
+        """
+        now = time.time()
+        window = self._funding_cache.get(coin)
+        if window and now - window.loaded_at < self._funding_cache_ttl:
+            window.evict_before(int(datetime.now().timestamp()) - self._funding_hours * 3600)
+            return window.sorted_rates
+        
+        history = self.db.get_funding_history(coin, hours=self._funding_hours, with_timestamp=True)
+        window = _FundingWindow(history, now)
+        self._funding_cache[coin] = window
+        return window.sorted_rates
\ No newline at end of file
@@ -5,21 +5,27 @@
 
 import os
 import json
-import requests
 import time
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from typing import Dict, List, Optional
 import logging
 
+from utils.helpers import create_http_session, DEFAULT_TIMEOUT, RateLimiter
+
 logger = logging.getLogger(__name__)
 
 # 缓存目录
 CACHE_DIR = os.path.join(os.path.dirname(__file__), '..', '.cache')
 
+# 信号线程会并发拉取各币种K线，共享同一限频
+PRICE_REQUESTS_PER_SECOND = 5
+
 
 class PriceCache:
     """价格数据缓存管理"""
     
+    __slots__ = ('cache_dir',)
+    
     def __init__(self, cache_dir: str = CACHE_DIR):
         self.cache_dir = os.path.abspath(cache_dir)
         os.makedirs(self.cache_dir, exist_ok=True)
@@ -27,22 +33,26 @@ class PriceCache:
     def _get_cache_path(self, coin: str, data_type: str) -> str:
         return os.path.join(self.cache_dir, f"{coin.lower()}_{data_type}.json")
     
-    def is_valid(self, coin: str, data_type: str, max_age_hours: int = 24) -> bool:
-        """检查缓存是否有效"""
-        path = self._get_cache_path(coin, data_type)
-        if not os.path.exists(path):
-            return False
-        
-        mtime = datetime.fromtimestamp(os.path.getmtime(path))
-        age = datetime.now() - mtime
-        return age.total_seconds() < max_age_hours * 3600
-    
     def load(self, coin: str, data_type: str) -> Optional[List[Dict]]:
         """加载缓存数据"""
         path = self._get_cache_path(coin, data_type)
         try:
-            with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(path, 'rb') as f:
+                return json.loads(f.read())
+        except Exception:
+            return None
+    
+    def load_if_valid(self, coin: str, data_type: str, max_age_hours: int = 24) -> Optional[List[Dict]]:
+        """
+        缓存未过期时加载数据 (一次 open，通过 fstat 判断新鲜度)
+        :return: 缓存数据，不存在、过期或损坏时返回 None
+        """
+        path = self._get_cache_path(coin, data_type)
+        try:
+            with open(path, 'rb') as f:
+                if time.time() - os.fstat(f.fileno()).st_mtime >= max_age_hours * 3600:
+                    return None
+                return json.loads(f.read())
         except Exception:
             return None
     
@@ -50,8 +60,9 @@ class PriceCache:
         """保存数据到缓存"""
         path = self._get_cache_path(coin, data_type)
         try:
-            with open(path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2, default=str)
+            # 缓存只供程序读取，紧凑格式即可
+            with open(path, 'wb') as f:
+                f.write(json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8'))
         except Exception as e:
             logger.warning(f"缓存保存失败: {e}")
 
@@ -59,21 +70,29 @@ class PriceCache:
 class TechnicalAnalysis:
     """技术分析工具"""
     
+    __slots__ = ('config', 'cache', 'session', 'exchange', 'price_data', '_closes', '_price_limiter')
+    
     def __init__(self, config: dict = None, exchange = None):
         self.config = config or {}
         self.cache = PriceCache()
-        self.session = requests.Session()
+        self.session = create_http_session()
+        self._price_limiter = RateLimiter(PRICE_REQUESTS_PER_SECOND)
         self.exchange = exchange
         self.price_data = {}  # {coin: [{date, price}, ...]}
+        self._closes: Dict[str, List[float]] = {}  # {coin: [close, ...]}，与 price_data 同步
+    
+    def _set_price_data(self, coin: str, records: List[Dict]):
+        """更新价格数据，同时生成收盘价序列供指标计算复用"""
+        self.price_data[coin] = records
+        self._closes[coin] = [p['close'] for p in records]
     
     def fetch_price_history(self, coin: str, days: int = 60) -> List[Dict]:
         """获取历史价格（优先使用交易所数据）"""
         # 检查缓存
-        if self.cache.is_valid(coin, 'price', max_age_hours=6):
-            cached = self.cache.load(coin, 'price')
-            if cached and len(cached) >= days:
-                self.price_data[coin] = cached[-days:]
-                return self.price_data[coin]
+        cached = self.cache.load_if_valid(coin, 'price', max_age_hours=6)
+        if cached and len(cached) >= days:
+            self._set_price_data(coin, cached[-days:])
+            return self.price_data[coin]
         
         logger.info(f"获取 {coin} 历史价格...")
         
@@ -84,24 +103,22 @@ class TechnicalAnalysis:
                 start_time = end_time - timedelta(days=days + 5) # 多取几天防缺失
                 
                 # OKX/Binance 均支持 1D
+                self._price_limiter.wait()
                 klines = self.exchange.get_historical_klines(coin, '1D', start_time, end_time)
                 
                 if klines and len(klines) >= days:
-                    records = []
-                    for item in klines:
-                        # 兼容处理: 交易所返回的是 timestamp 对象，需转为字符串 date
-                        dt = item['timestamp']
-                        records.append({
-                            'date': dt.strftime('%Y-%m-%d'),
-                            'close': float(item['close'])
-                        })
+                    # 兼容处理: 交易所返回的是 datetime 对象，取 ISO 格式前 10 位即 YYYY-MM-DD
+                    records = [
+                        {'date': item['timestamp'].isoformat()[:10], 'close': float(item['close'])}
+                        for item in klines
+                    ]
                     
                     # 确保按时间升序
                     records.sort(key=lambda x: x['date'])
                     
                     # 缓存
                     self.cache.save(coin, 'price', records)
-                    self.price_data[coin] = records
+                    self._set_price_data(coin, records)
                     return records
             except Exception as e:
                 logger.warning(f"交易所获取K线失败: {e}, 尝试备用 API")
@@ -115,7 +132,8 @@ class TechnicalAnalysis:
         }
         
         try:
-            response = self.session.get(url, params=params, timeout=30)
+            self._price_limiter.wait()
+            response = self.session.get(url, params=params, timeout=DEFAULT_TIMEOUT)
             response.raise_for_status()
             data = response.json()
             
@@ -123,18 +141,16 @@ class TechnicalAnalysis:
                 logger.error(f"API 错误: {data.get('Message')}")
                 return []
             
-            records = []
-            for item in data.get('Data', {}).get('Data', []):
-                if item['close'] > 0:
-                    dt = datetime.fromtimestamp(item['time'])
-                    records.append({
-                        'date': dt.strftime('%Y-%m-%d'),
-                        'close': item['close'],
-                    })
+            fromtimestamp = date.fromtimestamp
+            records = [
+                {'date': fromtimestamp(item['time']).isoformat(), 'close': item['close']}
+                for item in data.get('Data', {}).get('Data', [])
+                if item['close'] > 0
+            ]
             
             # 缓存
             self.cache.save(coin, 'price', records)
-            self.price_data[coin] = records
+            self._set_price_data(coin, records)
             
             return records
             
@@ -184,7 +200,7 @@ class TechnicalAnalysis:
         if coin not in self.price_data or len(self.price_data[coin]) < 30:
             return result
         
-        prices = [p['close'] for p in self.price_data[coin]]
+        prices = self._closes[coin]
         
         # 2. 计算 MA
         ma_short = self.calculate_ma(prices, ma_short_period)
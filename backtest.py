@@ -8,18 +8,26 @@
 4. 更智能的信号生成
 """
 
-import requests
-import time
 import os
 import json
 import statistics
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date as date_cls, datetime
+from itertools import accumulate
+from typing import Dict, List, Optional, Tuple
 import logging
 
+from utils.helpers import create_http_session, RateLimiter
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# 并发获取价格的最大线程数 (兼顾 CryptoCompare 限频)
+FETCH_WORKERS = 4
+# CryptoCompare 请求频率上限 (次/秒)，免费额度留足余量
+PRICE_REQUESTS_PER_SECOND = 10
+
 # 缓存目录
 CACHE_DIR = os.path.join(os.path.dirname(__file__), '.cache')
 
@@ -27,6 +35,8 @@ CACHE_DIR = os.path.join(os.path.dirname(__file__), '.cache')
 class PriceCache:
     """价格数据缓存管理"""
     
+    __slots__ = ('cache_dir',)
+    
     def __init__(self, cache_dir: str = CACHE_DIR):
         self.cache_dir = cache_dir
         os.makedirs(cache_dir, exist_ok=True)
@@ -34,36 +44,45 @@ class PriceCache:
     def _get_cache_path(self, coin: str, data_type: str) -> str:
         return os.path.join(self.cache_dir, f"{coin.lower()}_{data_type}.json")
     
-    def is_valid(self, coin: str, data_type: str, max_age_hours: int = 24) -> bool:
-        """检查缓存是否有效"""
-        path = self._get_cache_path(coin, data_type)
-        if not os.path.exists(path):
-            return False
-        
-        # 检查文件修改时间
-        mtime = datetime.fromtimestamp(os.path.getmtime(path))
-        age = datetime.now() - mtime
-        return age.total_seconds() < max_age_hours * 3600
-    
     def load(self, coin: str, data_type: str) -> Optional[List[Dict]]:
         """加载缓存数据"""
         path = self._get_cache_path(coin, data_type)
         try:
-            with open(path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                logger.info(f"📦 从缓存加载 {coin} {data_type} 数据 ({len(data)} 条)")
+            with open(path, 'rb') as f:
+                data = json.loads(f.read())
+                logger.info("📦 从缓存加载 %s %s 数据 (%d 条)", coin, data_type, len(data))
                 return data
         except Exception as e:
             logger.warning(f"缓存加载失败: {e}")
             return None
     
+    def load_if_valid(self, coin: str, data_type: str, max_age_hours: int = 24) -> Optional[List[Dict]]:
+        """
+        缓存未过期时加载数据 (一次 open，通过 fstat 判断新鲜度)
+        :return: 缓存数据，不存在、过期或损坏时返回 None
+        """
+        path = self._get_cache_path(coin, data_type)
+        try:
+            with open(path, 'rb') as f:
+                if time.time() - os.fstat(f.fileno()).st_mtime >= max_age_hours * 3600:
+                    return None
+                data = json.loads(f.read())
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"缓存加载失败: {e}")
+            return None
+        logger.info("📦 从缓存加载 %s %s 数据 (%d 条)", coin, data_type, len(data))
+        return data
+    
     def save(self, coin: str, data_type: str, data: List[Dict]):
         """保存数据到缓存"""
         path = self._get_cache_path(coin, data_type)
         try:
-            with open(path, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2, default=str)
-            logger.info(f"💾 已缓存 {coin} {data_type} 数据")
+            # 缓存只供程序读取，紧凑格式即可 (与 analyzers/trend.py 共用同一格式)
+            with open(path, 'wb') as f:
+                f.write(json.dumps(data, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8'))
+            logger.info("💾 已缓存 %s %s 数据", coin, data_type)
         except Exception as e:
             logger.warning(f"缓存保存失败: {e}")
 
@@ -71,16 +90,19 @@ class PriceCache:
 class TechnicalAnalysis:
     """技术分析工具"""
     
+    __slots__ = ()
+    
     @staticmethod
-    def calculate_ma(prices: List[float], period: int) -> List[Optional[float]]:
-        """计算移动平均线"""
-        ma = []
-        for i in range(len(prices)):
-            if i < period - 1:
-                ma.append(None)
-            else:
-                avg = sum(prices[i - period + 1:i + 1]) / period
-                ma.append(round(avg, 2))
+    def calculate_ma(prices: List[float], period: int,
+                     prefix_sums: Optional[List[float]] = None) -> List[Optional[float]]:
+        """
+        计算移动平均线 (前缀和，O(N))
+        :param prefix_sums: 可选，预先算好的前缀和 (长度 N+1)，多个周期共用时传入
+        """
+        n = len(prices)
+        cum = prefix_sums if prefix_sums is not None else list(accumulate(prices, initial=0.0))
+        ma: List[Optional[float]] = [None] * min(period - 1, n)
+        ma.extend((cum[i + 1] - cum[i + 1 - period]) / period for i in range(period - 1, n))
         return ma
     
     @staticmethod
@@ -91,8 +113,7 @@ class TechnicalAnalysis:
             if i < days:
                 changes.append(None)
             else:
-                change = (prices[i] - prices[i - days]) / prices[i - days] * 100
-                changes.append(round(change, 2))
+                changes.append((prices[i] - prices[i - days]) / prices[i - days] * 100)
         return changes
     
     @staticmethod
@@ -108,10 +129,74 @@ class TechnicalAnalysis:
         if len(prices) < lookback + 1:
             return False
         recent = prices[-lookback:]
-        for i in range(1, len(recent)):
-            if recent[i] <= recent[i-1]:
-                return False
-        return True
+        return all(prev < cur for prev, cur in zip(recent, recent[1:]))
+
+
+def _trailing_exit(
+    prices: List[Optional[float]],
+    entry_price: float,
+    trailing_frac: float
+) -> Optional[float]:
+    """
+    移动止损内核：逐日抬高最高价，返回首个触及止损线的价格
+    :param prices: 买入后的逐日收盘价（缺失日为 None）
+    :param entry_price: 买入价
+    :param trailing_frac: 止损线相对最高价的比例（-15% 对应 0.85）
+    :return: 止损价格，未触发返回 None
+    """
+    max_price = entry_price
+    for price in prices:
+        if not price:
+            continue
+        if price > max_price:
+            max_price = price
+        if price <= max_price * trailing_frac:
+            return price
+    return None
+
+
+def _simulate_trade(
+    prices: List[Optional[float]],
+    entry_price: float,
+    stop_frac: float,
+    trailing: bool,
+    hold_days: List[int]
+) -> Tuple[Optional[int], float, float, List[Tuple[int, float]]]:
+    """
+    单笔持仓模拟内核：逐日更新最高价与止损线，统计回撤，记录指定持有天数的价格
+    :param prices: 买入后第 1..N 天的收盘价（缺失日为 None）
+    :param entry_price: 买入价
+    :param stop_frac: 止损线相对买入价 / 最高价的比例（-15% 对应 0.85）
+    :param trailing: 是否为移动止损（随最高价抬高止损线）
+    :param hold_days: 需要记录价格的持有天数
+    :return: (止损触发日，未触发为 None, 止损价, 最大回撤%, [(持有天数, 当日价格), ...])
+    """
+    max_price = entry_price
+    stop_price = entry_price * stop_frac
+    max_drawdown = 0
+    checkpoints = []
+    
+    for day, price in enumerate(prices, 1):
+        if not price:
+            continue
+        
+        # 1. 更新最高价，移动止损同时抬高止损线
+        if price > max_price:
+            max_price = price
+            if trailing:
+                stop_price = max(stop_price, max_price * stop_frac)
+        
+        # 2. 由最高点回撤幅度（用于统计最大回撤）
+        max_drawdown = min(max_drawdown, (price - max_price) / max_price * 100)
+        
+        # 3. 触及止损线，近似以止损价成交
+        if price <= stop_price:
+            return day, stop_price, max_drawdown, checkpoints
+        
+        if day in hold_days:
+            checkpoints.append((day, price))
+    
+    return None, stop_price, max_drawdown, checkpoints
 
 
 class EnhancedBacktester:
@@ -119,7 +204,9 @@ class EnhancedBacktester:
     
     def __init__(self, config: dict = None):
         self.config = config or self._default_config()
-        self.session = requests.Session()
+        # 多币种并发拉取共用连接池，瞬时错误由传输层重试
+        self.session = create_http_session(retries=3, backoff_factor=0.5, pool_maxsize=FETCH_WORKERS)
+        self._price_limiter = RateLimiter(PRICE_REQUESTS_PER_SECOND)
         self.cache = PriceCache()
         self.ta = TechnicalAnalysis()
         
@@ -129,6 +216,15 @@ class EnhancedBacktester:
         self.signals = []
         self.results = []
         
+        # 按自然日对齐的收盘价缓存 (coin -> 价格数组 / 日期 -> 下标)
+        self._price_arrays: Dict[str, List[Optional[float]]] = {}
+        self._date_index: Dict[str, Dict[str, int]] = {}
+        self._start_ordinal: Dict[str, int] = {}  # 数组下标 0 对应日期的序数
+        # 日期 -> price_data 记录下标 (同一日期取第一条)
+        self._record_index: Dict[str, Dict[str, int]] = {}
+        # 技术指标缓存: coin -> (价格记录列表, 均线周期, 分析结果)，参数扫描时复用
+        self._analysis_cache: Dict[str, Tuple[List[Dict], Tuple[int, int, int], Dict]] = {}
+        
     def _default_config(self) -> dict:
         return {
             'thresholds': {
@@ -158,11 +254,10 @@ class EnhancedBacktester:
     def fetch_fear_greed_history(self, days: int = 365) -> List[Dict]:
         """获取历史恐慌指数（带缓存）"""
         # 检查缓存
-        if self.cache.is_valid('fg', 'index', max_age_hours=12):
-            cached = self.cache.load('fg', 'index')
-            if cached and len(cached) >= days:
-                self.fear_greed_data = cached[-days:]
-                return self.fear_greed_data
+        cached = self.cache.load_if_valid('fg', 'index', max_age_hours=12)
+        if cached and len(cached) >= days:
+            self.fear_greed_data = cached[-days:]
+            return self.fear_greed_data
         
         logger.info(f"正在获取恐慌指数历史数据 (目标: {days} 天)...")
         
@@ -174,15 +269,16 @@ class EnhancedBacktester:
             response.raise_for_status()
             data = response.json()
             
-            records = []
-            for item in data.get('data', []):
-                timestamp = int(item['timestamp'])
-                dt = datetime.fromtimestamp(timestamp)
-                records.append({
-                    'date': dt.strftime('%Y-%m-%d'),
+            # 日期只需 YYYY-MM-DD，直接由 date 生成，避免逐条 strftime
+            fromtimestamp = date_cls.fromtimestamp
+            records = [
+                {
+                    'date': fromtimestamp(int(item['timestamp'])).isoformat(),
                     'value': int(item['value']),
                     'classification': item['value_classification']
-                })
+                }
+                for item in data.get('data', [])
+            ]
             
             records.sort(key=lambda x: x['date'])
             
@@ -204,11 +300,10 @@ class EnhancedBacktester:
     def fetch_price_history(self, coin: str, days: int = 365) -> List[Dict]:
         """获取历史价格（带缓存）"""
         # 检查缓存
-        if self.cache.is_valid(coin, 'price', max_age_hours=24):
-            cached = self.cache.load(coin, 'price')
-            if cached and len(cached) >= days:
-                self.price_data[coin] = cached[-days:]
-                return self.price_data[coin]
+        cached = self.cache.load_if_valid(coin, 'price', max_age_hours=24)
+        if cached and len(cached) >= days:
+            self._set_price_data(coin, cached[-days:])
+            return self.price_data[coin]
         
         logger.info(f"正在获取 {coin} 历史价格...")
         
@@ -220,6 +315,7 @@ class EnhancedBacktester:
         }
         
         try:
+            self._price_limiter.wait()
             response = self.session.get(url, params=params, timeout=60)
             response.raise_for_status()
             data = response.json()
@@ -228,18 +324,20 @@ class EnhancedBacktester:
                 logger.error(f"API 错误: {data.get('Message')}")
                 return []
             
-            records = []
-            for item in data.get('Data', {}).get('Data', []):
-                if item['close'] > 0:
-                    dt = datetime.fromtimestamp(item['time'])
-                    records.append({
-                        'date': dt.strftime('%Y-%m-%d'),
-                        'open': item['open'],
-                        'high': item['high'],
-                        'low': item['low'],
-                        'close': item['close'],
-                        'volume': item['volumeto']
-                    })
+            # 过滤无成交 (close<=0) 的日期，单个推导式完成筛选与构建
+            fromtimestamp = date_cls.fromtimestamp
+            records = [
+                {
+                    'date': fromtimestamp(item['time']).isoformat(),
+                    'open': item['open'],
+                    'high': item['high'],
+                    'low': item['low'],
+                    'close': item['close'],
+                    'volume': item['volumeto']
+                }
+                for item in data.get('Data', {}).get('Data', [])
+                if item['close'] > 0
+            ]
             
             # 缓存全部数据
             self.cache.save(coin, 'price', records)
@@ -247,7 +345,7 @@ class EnhancedBacktester:
             if days and len(records) > days:
                 records = records[-days:]
             
-            self.price_data[coin] = records
+            self._set_price_data(coin, records)
             logger.info(f"✅ 获取到 {coin} {len(records)} 条价格数据")
             
             return records
@@ -256,6 +354,77 @@ class EnhancedBacktester:
             logger.error(f"获取 {coin} 价格失败: {e}")
             return []
     
+    def _set_price_data(self, coin: str, records: List[Dict]):
+        """更新价格数据，并使派生缓存失效"""
+        self.price_data[coin] = records
+        self._price_arrays.pop(coin, None)
+        self._date_index.pop(coin, None)
+        self._start_ordinal.pop(coin, None)
+        self._record_index.pop(coin, None)
+        self._analysis_cache.pop(coin, None)
+    
+    def get_price_array(self, coin: str) -> List[Optional[float]]:
+        """
+        获取按自然日对齐的收盘价数组
+        下标 0 为最早日期，缺失日期为 None；每个币种只构建一次
+        """
+        if coin in self._price_arrays:
+            return self._price_arrays[coin]
+        
+        records = self.price_data.get(coin, [])
+        prices: List[Optional[float]] = []
+        date_index: Dict[str, int] = {}
+        start = 0
+        
+        if records:
+            # 日期均为 YYYY-MM-DD，用日序数做整数运算
+            ordinals = {p['date']: date_cls.fromisoformat(p['date']).toordinal() for p in records}
+            start = min(ordinals.values())
+            prices = [None] * (max(ordinals.values()) - start + 1)
+            for p in records:
+                if p['date'] in date_index:
+                    continue
+                idx = ordinals[p['date']] - start
+                prices[idx] = p['close']
+                date_index[p['date']] = idx
+        
+        self._price_arrays[coin] = prices
+        self._date_index[coin] = date_index
+        self._start_ordinal[coin] = start
+        return prices
+    
+    def _get_day_index(self, coin: str, date: str) -> Optional[int]:
+        """获取日期在自然日价格数组中的下标"""
+        self.get_price_array(coin)
+        return self._date_index[coin].get(date)
+    
+    def get_signal_windows(self, days: int) -> List[Tuple[float, List[Optional[float]]]]:
+        """
+        批量构建买入信号之后 N 天的价格窗口
+        :param days: 窗口天数
+        :return: [(买入价, 逐日收盘价), ...]，按信号顺序排列
+        """
+        windows = []
+        for signal in self.signals:
+            if signal['type'] != 'BUY':
+                continue
+            idx = self._get_day_index(signal['coin'], signal['date'])
+            if idx is None:
+                continue
+            prices = self._price_arrays[signal['coin']]
+            windows.append((signal['price'], prices[idx + 1:idx + days + 1]))
+        return windows
+    
+    def get_trade_cost(self) -> float:
+        """
+        单笔交易总成本 (双向手续费 + 滑点 + 执行延迟)
+        :return: 成本百分比
+        """
+        fee_rate = self.config.get('fee_rate', 0.1)
+        slippage = self.config.get('slippage', 0.1)
+        execution_delay = self.config.get('execution_delay', 0)
+        return fee_rate * 2 + slippage + execution_delay
+    
     def fetch_all_data(self, days: int = 365) -> bool:
         """获取所有数据"""
         logger.info("=" * 60)
@@ -265,50 +434,93 @@ class EnhancedBacktester:
         if not self.fetch_fear_greed_history(days):
             return False
         
-        for coin in self.config['coins']:
-            self.fetch_price_history(coin, days)
-            time.sleep(0.5)
+        # 各币种互不依赖，并发请求以重叠网络等待
+        coins = self.config['coins']
+        with ThreadPoolExecutor(max_workers=max(1, min(FETCH_WORKERS, len(coins)))) as pool:
+            list(pool.map(lambda coin: self.fetch_price_history(coin, days), coins))
         
         return True
     
     # ==================== 增强信号生成 ====================
     
     def _prepare_price_analysis(self, coin: str) -> Dict:
-        """准备价格分析数据"""
+        """准备价格分析数据 (价格记录与均线周期不变时直接复用上次结果)"""
         if coin not in self.price_data:
             return {}
         
-        prices = [p['close'] for p in self.price_data[coin]]
-        dates = [p['date'] for p in self.price_data[coin]]
-        
+        records = self.price_data[coin]
         ma_config = self.config['ma']
+        periods = (ma_config['short_period'], ma_config['long_period'], ma_config.get('trend_period', 200))
         
-        return {
+        cached = self._analysis_cache.get(coin)
+        if cached and cached[0] is records and cached[1] == periods:
+            return cached[2]
+        
+        prices = [p['close'] for p in records]
+        dates = [p['date'] for p in records]
+        
+        # 三条均线共用一份前缀和
+        prefix_sums = list(accumulate(prices, initial=0.0))
+        short_period, long_period, trend_period = periods
+        
+        analysis = {
             'dates': dates,
             'prices': prices,
-            'ma_short': self.ta.calculate_ma(prices, ma_config['short_period']),
-            'ma_long': self.ta.calculate_ma(prices, ma_config['long_period']),
-            'ma_trend': self.ta.calculate_ma(prices, ma_config.get('trend_period', 200)),
+            'ma_short': self.ta.calculate_ma(prices, short_period, prefix_sums),
+            'ma_long': self.ta.calculate_ma(prices, long_period, prefix_sums),
+            'ma_trend': self.ta.calculate_ma(prices, trend_period, prefix_sums),
             'change_7d': self.ta.calculate_price_change(prices, 7),
         }
+        self._analysis_cache[coin] = (records, periods, analysis)
+        return analysis
+    
+    @staticmethod
+    def _build_trend_mask(analysis: Dict) -> List[bool]:
+        """
+        逐个价格下标标记是否满足趋势条件 (与情绪无关的部分)
+        价格高于 MA7 / MA30、MA7 > MA30、7天涨幅非负，且已有 30 天以上数据
+        """
+        if not analysis:
+            return []
+        return [
+            i >= 30 and bool(ma_s) and bool(ma_l) and price > ma_s and price > ma_l
+            and ma_s > ma_l and change is not None and change >= 0
+            for i, (price, ma_s, ma_l, change) in enumerate(zip(
+                analysis['prices'], analysis['ma_short'], analysis['ma_long'], analysis['change_7d']
+            ))
+        ]
     
     def _get_price_index(self, coin: str, date: str) -> Optional[int]:
         """获取日期对应的价格索引"""
         if coin not in self.price_data:
             return None
-        for i, p in enumerate(self.price_data[coin]):
-            if p['date'] == date:
-                return i
-        return None
+        index = self._record_index.get(coin)
+        if index is None:
+            index = {}
+            for i, p in enumerate(self.price_data[coin]):
+                index.setdefault(p['date'], i)
+            self._record_index[coin] = index
+        return index.get(date)
+    
+    def _get_buy_thresholds(self) -> Tuple[float, float, float]:
+        """读取动量阈值 (高动量 7d 涨幅, 中动量 7d 涨幅, 有效信号最低分)"""
+        ma_config = self.config.get('ma', {})
+        return (
+            ma_config.get('high_momentum_7d', 10),
+            ma_config.get('medium_momentum_7d', 5),
+            ma_config.get('score_threshold', 5),
+        )
     
     def _check_buy_conditions(
         self, 
         fg_value: int, 
-        fg_values: List[int], 
+        fg_rising: List[bool], 
         fg_idx: int,
         coin: str,
         date: str,
-        analysis: Dict
+        analysis: Dict,
+        thresholds: Optional[Tuple[float, float, float]] = None,
+        price_idx: Optional[int] = None
     ) -> Dict:
         """
         V8 策略：趋势突破
@@ -325,8 +537,9 @@ class EnhancedBacktester:
         if fg_value > 70:
             return result
         
-        # 获取价格数据
-        price_idx = self._get_price_index(coin, date)
+        # 获取价格数据 (批量模拟时已按日期对齐好下标)
+        if price_idx is None:
+            price_idx = self._get_price_index(coin, date)
         if price_idx is None or not analysis or price_idx < 30:
             return result
         
@@ -355,11 +568,8 @@ class EnhancedBacktester:
         if change_7d is None or change_7d < 0:
             return result
         
-        # 使用可配置的动量阈值（避免硬编码过拟合）
-        ma_config = self.config.get('ma', {})
-        high_momentum = ma_config.get('high_momentum_7d', 10)
-        medium_momentum = ma_config.get('medium_momentum_7d', 5)
-        score_threshold = ma_config.get('score_threshold', 5)
+        # 使用可配置的动量阈值（避免硬编码过拟合），批量模拟时由调用方预先读取
+        high_momentum, medium_momentum, score_threshold = thresholds or self._get_buy_thresholds()
         
         if change_7d >= high_momentum:
             result['reasons'].append(f"📈 强势 7d+{change_7d:.1f}%")
@@ -373,10 +583,9 @@ class EnhancedBacktester:
             result['score'] += 1
         
         # 4. 情绪在恢复中加分
-        if fg_value < 50 and fg_idx >= 3:
-            if fg_values[fg_idx] > fg_values[fg_idx-1] > fg_values[fg_idx-2]:
-                result['reasons'].append("情绪回升")
-                result['score'] += 1
+        if fg_value < 50 and fg_rising[fg_idx]:
+            result['reasons'].append("情绪回升")
+            result['score'] += 1
         
         result['valid'] = result['score'] >= score_threshold
         return result
@@ -392,51 +601,88 @@ class EnhancedBacktester:
         
         signals = []
         fg_values = [d['value'] for d in self.fear_greed_data]
+        # 情绪连续两日回升 (前 3 天数据不足，不判断)，用连涨计数单次遍历
+        fg_rising = []
+        up_run = 0
+        prev = None
+        for i, value in enumerate(fg_values):
+            up_run = up_run + 1 if i and value > prev else 0
+            fg_rising.append(i >= 3 and up_run >= 2)
+            prev = value
         
         # 预计算所有币种的技术分析
-        coin_analysis = {coin: self._prepare_price_analysis(coin) for coin in self.config['coins']}
+        coins = tuple(self.config['coins'])
+        coin_analysis = {coin: self._prepare_price_analysis(coin) for coin in coins}
+        # 趋势条件只取决于价格，先整列算出，逐日只需对候选日打分
+        trend_masks = {coin: self._build_trend_mask(analysis) for coin, analysis in coin_analysis.items()}
         
+        # 情绪日期 -> 下标列表
+        fg_positions: Dict[str, List[int]] = {}
         for i, fg_data in enumerate(self.fear_greed_data):
+            fg_positions.setdefault(fg_data['date'], []).append(i)
+        
+        # 只遍历趋势条件成立的 (情绪日, 币种)，按日期、币种顺序排列，与逐日扫描的输出顺序一致
+        get_price_index = self._get_price_index
+        candidates = []
+        for coin_pos, coin in enumerate(coins):
+            dates = coin_analysis[coin].get('dates', [])
+            for price_idx, ok in enumerate(trend_masks[coin]):
+                # 同一日期有多条价格记录时只取第一条
+                if ok and get_price_index(coin, dates[price_idx]) == price_idx:
+                    for i in fg_positions.get(dates[price_idx], ()):
+                        candidates.append((i, coin_pos, coin, price_idx))
+        candidates.sort()
+        
+        # 循环内频繁调用的方法绑定为局部变量
+        check_buy = self._check_buy_conditions
+        buy_thresholds = self._get_buy_thresholds()
+        append_signal = signals.append
+        
+        for i, _, coin, price_idx in candidates:
+            fg_data = self.fear_greed_data[i]
             date = fg_data['date']
             fg_value = fg_data['value']
+            analysis = coin_analysis[coin]
             
-            for coin in self.config['coins']:
-                analysis = coin_analysis.get(coin, {})
-                
-                # 检查买入条件
-                buy_check = self._check_buy_conditions(
-                    fg_value, fg_values, i, coin, date, analysis
-                )
-                
-                if buy_check['valid']:
-                    price_idx = self._get_price_index(coin, date)
-                    price = analysis['prices'][price_idx] if price_idx and analysis else None
-                    
-                    if price:
-                        signals.append({
-                            'date': date,
-                            'coin': coin,
-                            'type': 'BUY',
-                            'fg_value': fg_value,
-                            'price': price,
-                            'score': buy_check['score'],
-                            'reasons': buy_check['reasons']
-                        })
+            # 检查买入条件
+            buy_check = check_buy(
+                fg_value, fg_rising, i, coin, date, analysis, buy_thresholds, price_idx
+            )
+            
+            if buy_check['valid']:
+                price = analysis['prices'][price_idx]
                 
-                # 注意：不再生成主动卖出信号
-                # 回测证明情绪卖出信号无效（正确率仅38%）
-                # 实际交易中应使用止损线（如-15%）代替
+                if price:
+                    append_signal({
+                        'date': date,
+                        'coin': coin,
+                        'type': 'BUY',
+                        'fg_value': fg_value,
+                        'price': price,
+                        'score': buy_check['score'],
+                        'reasons': buy_check['reasons']
+                    })
+        
+        # 注意：不再生成主动卖出信号
+        # 回测证明情绪卖出信号无效（正确率仅38%）
+        # 实际交易中应使用止损线（如-15%）代替
         
         self.signals = signals
         
-        # 统计
-        buy_signals = [s for s in signals if s['type'] == 'BUY']
-        sell_signals = [s for s in signals if s['type'] == 'SELL']
-        logger.info(f"✅ 生成 {len(signals)} 个信号 (买入: {len(buy_signals)}, 卖出: {len(sell_signals)})")
+        # 统计 (单次遍历按类型与分数分档计数)
+        buy_count = sell_count = high_score = mid_score = 0
+        for s in signals:
+            if s['type'] == 'BUY':
+                buy_count += 1
+                if s['score'] >= 5:
+                    high_score += 1
+                elif s['score'] >= 3:
+                    mid_score += 1
+            elif s['type'] == 'SELL':
+                sell_count += 1
+        logger.info(f"✅ 生成 {len(signals)} 个信号 (买入: {buy_count}, 卖出: {sell_count})")
         
         # 按分数统计买入信号
-        high_score = sum(1 for s in buy_signals if s['score'] >= 5)
-        mid_score = sum(1 for s in buy_signals if 3 <= s['score'] < 5)
         logger.info(f"   买入 - 高分(>=5): {high_score}, 中分(3-4): {mid_score}")
         
         return signals
@@ -493,17 +739,33 @@ class EnhancedBacktester:
     
     # ==================== 收益计算 ====================
     
-    def _get_price_after_days(self, coin: str, date: str, days: int) -> Optional[float]:
-        """获取 N 天后的价格"""
+    def _resolve_day_index(self, coin: str, date: str) -> Optional[int]:
+        """获取日期在自然日价格数组中的下标 (可能越界)，无该币种数据时返回 None"""
         if coin not in self.price_data:
             return None
         
-        target_date = (datetime.strptime(date, '%Y-%m-%d') + timedelta(days=days)).strftime('%Y-%m-%d')
+        self.get_price_array(coin)
+        idx = self._date_index[coin].get(date)
         
-        for p in self.price_data[coin]:
-            if p['date'] == target_date:
-                return p['close']
-        return None
+        if idx is None:
+            # 起始日无价格记录时，按日序数推算下标
+            idx = date_cls.fromisoformat(date).toordinal() - self._start_ordinal[coin]
+        return idx
+    
+    def _get_price_window(self, coin: str, date: str, days: int) -> List[Optional[float]]:
+        """
+        获取第 1..N 天的价格
+        :return: 长度为 N 的列表，超出数据范围的日期为 None
+        """
+        idx = self._resolve_day_index(coin, date)
+        if idx is None:
+            return [None] * days
+        
+        prices = self._price_arrays[coin]
+        lo, hi = idx + 1, idx + days + 1
+        if lo >= 0 and hi <= len(prices):
+            return prices[lo:hi]
+        return [prices[j] if 0 <= j < len(prices) else None for j in range(lo, hi)]
     
     def calculate_returns(self) -> List[Dict]:
         """计算收益（含动态止损分析 V2 + 手续费）"""
@@ -517,11 +779,15 @@ class EnhancedBacktester:
         # 获取手续费配置 (单边费率，双向需要 x2)
         fee_rate = self.config.get('fee_rate', 0.1)  # 默认 0.1%
         slippage = self.config.get('slippage', 0.1)  # 默认 0.1% 滑点
-        execution_delay = self.config.get('execution_delay', 0)  # 执行延迟成本
         round_trip_fee = fee_rate * 2  # 买入 + 卖出
-        total_cost = round_trip_fee + slippage + execution_delay  # 总交易成本
+        total_cost = self.get_trade_cost()  # 总交易成本
         
         results = []
+        # 持有期（最大30天）
+        hold_days = self.config['hold_days']
+        max_hold_days = max(hold_days)
+        stop_frac = 1 + stop_pct / 100
+        trailing = stop_type == 'trailing'
         
         for signal in self.signals:
             if signal['type'] != 'BUY':
@@ -539,58 +805,27 @@ class EnhancedBacktester:
             }
             
             # 模拟持仓过程
-            max_price = entry_price
-            current_stop_price = 0
+            window = self._get_price_window(signal['coin'], signal['date'], max_hold_days)
+            stop_day, stop_price, max_drawdown, checkpoints = _simulate_trade(
+                window, entry_price, stop_frac, trailing, hold_days
+            )
+            result['max_drawdown'] = max_drawdown
             
-            # 初始化止损线
-            if stop_type == 'trailing':
-                current_stop_price = entry_price * (1 + stop_pct / 100)
-            else:
-                current_stop_price = entry_price * (1 + stop_pct / 100)
-            
-            is_stopped = False
+            # 记录特定天数的持有收益（止损前）- 扣除交易成本
+            for day, day_price in checkpoints:
+                gross_ret = (day_price - entry_price) / entry_price * 100
+                net_ret = gross_ret - total_cost  # 扣除手续费+滑点
+                result['returns'][f'{day}d'] = round(net_ret, 2)
+                result['returns'][f'{day}d_gross'] = round(gross_ret, 2)  # 保留毛收益供对比
             
-            # 遍历持有期（最大30天）
-            max_hold_days = max(self.config['hold_days'])
-            
-            for day in range(1, max_hold_days + 1):
-                day_price = self._get_price_after_days(signal['coin'], signal['date'], day)
-                if not day_price:
-                    continue
-                
-                # 1. 更新最高价
-                if day_price > max_price:
-                    max_price = day_price
-                    # 如果是移动止损，抬高止损线
-                    if stop_type == 'trailing':
-                        new_stop = max_price * (1 + stop_pct / 100)
-                        current_stop_price = max(current_stop_price, new_stop)
-                
-                # 2. 检查由最高点回撤幅度（用于统计最大回撤）
-                drawdown_from_max = (day_price - max_price) / max_price * 100
-                result['max_drawdown'] = min(result['max_drawdown'], drawdown_from_max)
-                
-                # 3. 检查是否触及止损线
-                if day_price <= current_stop_price:
-                    is_stopped = True
-                    result['exit_reason'] = 'stop_loss'
-                    result['exit_price'] = current_stop_price # 近似以止损价成交
-                    result['exit_day'] = day
-                    break
-                
-                # 记录特定天数的持有收益（如果还没止损）- 扣除交易成本
-                if day in self.config['hold_days']:
-                    gross_ret = (day_price - entry_price) / entry_price * 100
-                    net_ret = gross_ret - total_cost  # 扣除手续费+滑点
-                    result['returns'][f'{day}d'] = round(net_ret, 2)
-                    result['returns'][f'{day}d_gross'] = round(gross_ret, 2)  # 保留毛收益供对比
-            
-            # 如果持有期结束还没止损，则以最后一天价格平仓
-            if not is_stopped:
-                final_price = self._get_price_after_days(signal['coin'], signal['date'], max_hold_days)
-                if final_price:
-                    result['exit_price'] = final_price
-                    result['exit_day'] = max_hold_days
+            if stop_day is not None:
+                result['exit_reason'] = 'stop_loss'
+                result['exit_price'] = stop_price
+                result['exit_day'] = stop_day
+            elif window and window[-1]:
+                # 持有期结束还没止损，则以最后一天价格平仓
+                result['exit_price'] = window[-1]
+                result['exit_day'] = max_hold_days
             
             # 计算最终交易收益（基于退出价格）- 扣除交易成本
             gross_return = (result['exit_price'] - entry_price) / entry_price * 100
@@ -614,19 +849,30 @@ class EnhancedBacktester:
         
         buy_results = self.results
         
-        # 1. 基础统计
+        # 单次遍历收集各项明细
         total_signals = len(buy_results)
-        hit_stop = sum(1 for r in buy_results if r.get('exit_reason') == 'stop_loss')
-        avg_drawdown = statistics.mean([r.get('max_drawdown', 0) for r in buy_results]) if buy_results else 0
+        hit_stop = 0
+        win_count = 0
+        drawdowns = []
+        final_returns = []
+        final_returns_gross = []
+        for r in buy_results:
+            if r.get('exit_reason') == 'stop_loss':
+                hit_stop += 1
+            final_return = r.get('final_return', 0)
+            if final_return > 0:
+                win_count += 1
+            drawdowns.append(r.get('max_drawdown', 0))
+            final_returns.append(final_return)
+            final_returns_gross.append(r.get('final_return_gross', 0))
         
-        # 2. 收益统计 (基于 final_return - 已扣手续费)
-        final_returns = [r.get('final_return', 0) for r in buy_results]
-        final_returns_gross = [r.get('final_return_gross', 0) for r in buy_results]
+        # 1. 基础统计
+        avg_drawdown = statistics.fmean(drawdowns) if drawdowns else 0
         
-        win_count = sum(1 for r in final_returns if r > 0)
+        # 2. 收益统计 (基于 final_return - 已扣手续费)
         win_rate = win_count / total_signals * 100 if total_signals > 0 else 0
-        avg_return = statistics.mean(final_returns) if final_returns else 0
-        avg_return_gross = statistics.mean(final_returns_gross) if final_returns_gross else 0
+        avg_return = statistics.fmean(final_returns) if final_returns else 0
+        avg_return_gross = statistics.fmean(final_returns_gross) if final_returns_gross else 0
         total_return = sum(final_returns)
         total_return_gross = sum(final_returns_gross)
         
@@ -635,7 +881,7 @@ class EnhancedBacktester:
         slippage = self.config.get('slippage', 0.1)
         execution_delay = self.config.get('execution_delay', 0)
         round_trip_fee = fee_rate * 2
-        total_cost_per_trade = round_trip_fee + slippage + execution_delay
+        total_cost_per_trade = self.get_trade_cost()
         total_trading_cost = total_cost_per_trade * total_signals  # 总交易成本
         
         # 4. 风险配置回顾
@@ -870,17 +1116,28 @@ class EnhancedBacktester:
         if not results:
             return {}
         
-        final_returns = [r.get('final_return', 0) for r in results]
-        win_count = sum(1 for r in final_returns if r > 0)
+        # 单次遍历收集收益、胜场与极值 (results 非空)
+        final_returns = []
+        win_count = 0
+        max_return = min_return = results[0].get('final_return', 0)
+        for r in results:
+            final_return = r.get('final_return', 0)
+            final_returns.append(final_return)
+            if final_return > 0:
+                win_count += 1
+            if final_return > max_return:
+                max_return = final_return
+            elif final_return < min_return:
+                min_return = final_return
         total = len(results)
         
         stats = {
             'count': total,
-            'avg_return': statistics.mean(final_returns) if final_returns else 0,
+            'avg_return': statistics.fmean(final_returns),
             'total_return': sum(final_returns),
-            'win_rate': win_count / total * 100 if total > 0 else 0,
-            'max_return': max(final_returns) if final_returns else 0,
-            'min_return': min(final_returns) if final_returns else 0,
+            'win_rate': win_count / total * 100,
+            'max_return': max_return,
+            'min_return': min_return,
         }
         
         print(f"\n📊 {label}:")
@@ -975,27 +1232,34 @@ def optimize_stop_loss():
     
     results = []
     
+    # 所有买入信号的价格窗口只构建一次，固定止损与动态止损各档位共用
+    windows = backtester.get_signal_windows(30)
+    # 收益均扣除单笔交易成本，与 calculate_returns 一致
+    total_cost = backtester.get_trade_cost()
+    
+    # 与档位无关的逐信号数据只提取一次: (30天内最大跌幅, 第30天收益)
+    trades = []
+    for buy_price, window in windows:
+        worst = min(((p - buy_price) / buy_price * 100 for p in window if p), default=None)
+        ret_30d = (window[-1] - buy_price) / buy_price * 100 if len(window) == 30 and window[-1] else None
+        trades.append((worst, ret_30d))
+    
     for stop_loss in stop_levels:
-        backtester.config['stop_loss'] = stop_loss
-        backtester.calculate_returns()
-        
-        # 统计
-        hit_count = sum(1 for r in backtester.results if r.get('hit_stop_loss', False))
-        hit_rate = hit_count / len(backtester.results) * 100 if backtester.results else 0
-        
-        # 计算如果止损后不持有的收益
+        hit_count = 0
         total_return = 0
         count = 0
-        for r in backtester.results:
-            ret_30d = r['returns'].get('30d')
-            if ret_30d is not None:
-                if r.get('hit_stop_loss'):
-                    # 止损执行，收益为止损线
-                    total_return += stop_loss
-                else:
-                    total_return += ret_30d
+        for worst, ret_30d in trades:
+            if worst is not None and worst <= stop_loss:
+                # 止损执行，收益为止损线 (不依赖30天后是否有价格)
+                hit_count += 1
+                total_return += stop_loss - total_cost
+                count += 1
+            elif ret_30d is not None:
+                # 未触发止损，持有到30天
+                total_return += ret_30d - total_cost
                 count += 1
         
+        hit_rate = hit_count / len(trades) * 100 if trades else 0
         avg_return = total_return / count if count else 0
         
         results.append({
@@ -1034,33 +1298,17 @@ def optimize_stop_loss():
         total_return = 0
         count = 0
         
-        for signal in backtester.signals:
-            if signal['type'] != 'BUY':
-                continue
-            
-            buy_price = signal['price']
-            max_price = buy_price
-            exit_price = None
-            
-            # 模拟每天价格
-            for day in range(1, 31):
-                day_price = backtester._get_price_after_days(signal['coin'], signal['date'], day)
-                if not day_price:
-                    continue
-                
-                max_price = max(max_price, day_price)
-                trailing_stop = max_price * (1 + trail_pct / 100)
-                
-                if day_price <= trailing_stop:
-                    exit_price = day_price
-                    break
+        trailing_frac = 1 + trail_pct / 100
+        
+        for buy_price, window in windows:
+            exit_price = _trailing_exit(window, buy_price, trailing_frac)
             
-            if exit_price is None:
+            if exit_price is None and len(window) == 30:
                 # 持有到30天
-                exit_price = backtester._get_price_after_days(signal['coin'], signal['date'], 30)
+                exit_price = window[-1]
             
             if exit_price:
-                ret = (exit_price - buy_price) / buy_price * 100
+                ret = (exit_price - buy_price) / buy_price * 100 - total_cost
                 total_return += ret
                 count += 1
         
@@ -5,27 +5,42 @@
 
 import sqlite3
 import json
-from datetime import datetime
-from typing import Dict, List, Optional
+import threading
+import functools
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+def _synchronized(method: Callable) -> Callable:
+    """在实例锁内执行数据库方法，使共享连接上的查询与提交串行进行"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
 class DatabaseManager:
     """数据库管理器"""
     
     def __init__(self, db_file='crypto_sentiment_v3.db'):
         self.db_file = db_file
         self.conn = None
+        # 信号生成会在工作线程中读取历史，共享连接上的所有操作经 _synchronized 串行执行
+        self._lock = threading.Lock()
         self.init_database()
     
     def get_connection(self):
         """获取数据库连接"""
         if self.conn is None:
-            self.conn = sqlite3.connect(self.db_file)
+            self.conn = sqlite3.connect(self.db_file, check_same_thread=False)
             self.conn.row_factory = sqlite3.Row
         return self.conn
     
+    @_synchronized
     def init_database(self):
         """初始化数据库表结构"""
         conn = self.get_connection()
@@ -84,10 +99,33 @@ class DatabaseManager:
         conn.commit()
         logger.info("数据库初始化完成")
     
-    def save_market_data(self, data: dict):
+    @staticmethod
+    def _parse_timestamp(ts_val) -> Optional[int]:
+        """
+        解析 market_data 中的时间戳
+        旧版本以 CURRENT_TIMESTAMP 写入文本时间 (UTC)，读取时转换为整数秒，不改写库中数据
+        :param ts_val: 整数秒或 SQLite 文本时间
+        :return: 整数秒，无法识别时返回 None
+        """
+        if isinstance(ts_val, (int, float)):
+            return ts_val
+        if isinstance(ts_val, str):
+            try:
+                # SQLite CURRENT_TIMESTAMP 格式为空格分隔，需转换为 ISO 格式
+                dt = datetime.fromisoformat(ts_val.replace(' ', 'T'))
+            except ValueError:
+                return None
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=timezone.utc)
+            return int(dt.timestamp())
+        return None
+    
+    @_synchronized
+    def save_market_data(self, data: dict) -> Optional[int]:
         """
         保存市场数据
         :param data: 包含fear_greed和coins的字典
+        :return: 写入记录的时间戳，失败返回 None
         """
         conn = self.get_connection()
         cursor = conn.cursor()
@@ -95,23 +133,27 @@ class DatabaseManager:
         try:
             # 序列化币种数据为JSON
             coins_json = json.dumps(data.get('coins', {}))
+            timestamp = int(datetime.now().timestamp())
             
             cursor.execute('''
                 INSERT INTO market_data (timestamp, fear_greed_index, coins_data)
                 VALUES (?, ?, ?)
             ''', (
-                int(datetime.now().timestamp()),
+                timestamp,
                 data['fear_greed']['value'] if data.get('fear_greed') else None,
                 coins_json
             ))
             
             conn.commit()
             logger.debug("市场数据已保存")
+            return timestamp
         
         except Exception as e:
             logger.error(f"保存市场数据失败: {e}")
             conn.rollback()
+            return None
     
+    @_synchronized
     def save_signal(self, signal: dict, data: dict):
         """
         保存交易信号
@@ -151,6 +193,7 @@ class DatabaseManager:
             logger.error(f"保存信号失败: {e}")
             conn.rollback()
     
+    @_synchronized
     def get_fear_greed_history(self, hours: int = 72) -> List[Dict]:
         """
         获取恐慌指数历史
@@ -171,23 +214,84 @@ class DatabaseManager:
                 ORDER BY timestamp
             ''', (start_ts,))
             
+            # 文本时间在 SQLite 中总是大于整数，会通过时间过滤并排在最后，转换后需重新过滤、排序
             history = []
+            has_text = False
             for row in cursor.fetchall():
+                ts = self._parse_timestamp(row[1])
+                if ts is None or ts < start_ts:
+                    continue
+                has_text = has_text or isinstance(row[1], str)
+                history.append({
+                    'value': row[0],
+                    'timestamp': ts  # 整数时间戳
+                })
+            if has_text:
+                history.sort(key=lambda item: item['timestamp'])
+            return history
+        
+        except Exception as e:
+            logger.error(f"获取恐慌指数历史失败: {e}")
+            return []
+    
+    @_synchronized
+    def get_fear_greed_tail(self, limit: int, hours: int = 72) -> List[Dict]:
+        """
+        获取最近N条恐慌指数 (时间正序)
+        :param limit: 最多返回的条数
+        :param hours: 只取最近N小时内的数据
+        :return: 恐慌指数列表，格式同 get_fear_greed_history
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        try:
+            start_ts = int(datetime.now().timestamp()) - (hours * 3600)
+            
+            # 倒序扫描时旧版文本时间排在最前 (SQLite 中文本大于整数)，
+            # 因此不在 SQL 中 LIMIT，而是取全部文本行和最新 limit 条整数行，转换后再截取
+            cursor.execute('''
+                SELECT fear_greed_index, timestamp FROM market_data
+                WHERE fear_greed_index IS NOT NULL
+                AND timestamp >= ?
+                ORDER BY timestamp DESC, id DESC
+            ''', (start_ts,))
+            
+            history = []
+            numeric_count = 0
+            has_text = False
+            for row in cursor:
+                if isinstance(row[1], str):
+                    ts = self._parse_timestamp(row[1])
+                    if ts is None or ts < start_ts:
+                        continue
+                    has_text = True
+                else:
+                    if numeric_count >= limit:
+                        break
+                    ts = row[1]
+                    numeric_count += 1
                 history.append({
                     'value': row[0],
-                    'timestamp': row[1]  # 直接返回整数时间戳
+                    'timestamp': ts
                 })
+            history.reverse()
+            if has_text:
+                history.sort(key=lambda item: item['timestamp'])
+                history = history[-limit:]
             return history
         
         except Exception as e:
             logger.error(f"获取恐慌指数历史失败: {e}")
             return []
     
-    def get_funding_history(self, coin: str, hours: int = 168) -> List[float]:
+    @_synchronized
+    def get_funding_history(self, coin: str, hours: int = 168, with_timestamp: bool = False) -> List:
         """
         获取资金费率历史
         :param coin: 币种符号
         :param hours: 获取最近N小时的数据
+        :param with_timestamp: 为 True 时返回 (时间戳, 费率) 元组
         :return: 资金费率列表
         """
         conn = self.get_connection()
@@ -197,28 +301,40 @@ class DatabaseManager:
             start_ts = int(datetime.now().timestamp()) - (hours * 3600)
             
             cursor.execute(f'''
-                SELECT coins_data FROM market_data
+                SELECT coins_data, timestamp FROM market_data
                 WHERE timestamp >= ?
                 ORDER BY timestamp
             ''', (start_ts,))
+            rows = cursor.fetchall()
             
             rates = []
-            for row in cursor.fetchall():
+            has_text = False
+            for row in rows:
+                ts = row[1]
+                if isinstance(ts, str):
+                    # 旧版文本时间总能通过 SQL 时间过滤，转换后重新判断
+                    ts = self._parse_timestamp(ts)
+                    if ts is None or ts < start_ts:
+                        continue
+                    has_text = True
                 try:
                     coins_data = json.loads(row[0])
                     if coin in coins_data:
                         funding = coins_data[coin].get('funding_rate')
                         if funding is not None:
-                            rates.append(funding)
+                            rates.append((ts, funding) if with_timestamp else funding)
                 except json.JSONDecodeError:
                     continue
             
+            if with_timestamp and has_text:
+                rates.sort(key=lambda item: item[0])
             return rates
         
         except Exception as e:
             logger.error(f"获取资金费率历史失败: {e}")
             return []
     
+    @_synchronized
     def get_signal_statistics(self) -> Dict:
         """
         获取信号统计
@@ -318,6 +434,7 @@ class DatabaseManager:
         
         return {'risk_level': risk_level, 'warnings': warnings}
     
+    @_synchronized
     def get_pending_backtest_signals(self, days_list: List[int]) -> List[Dict]:
         """
         获取需要回测的信号
@@ -361,6 +478,7 @@ class DatabaseManager:
             logger.error(f"获取待回测信号失败: {e}")
             return []
     
+    @_synchronized
     def update_backtest_results(self, signal_id: int, results: Dict):
         """
         更新回测结果
@@ -399,6 +517,7 @@ class DatabaseManager:
             logger.error(f"更新回测结果失败: {e}")
             conn.rollback()
     
+    @_synchronized
     def get_price_at_time(self, coin: str, timestamp: datetime) -> Optional[float]:
         """
         从历史数据中获取指定时间的价格
@@ -428,6 +547,7 @@ class DatabaseManager:
         
         return None
     
+    @_synchronized
     def close(self):
         """关闭数据库连接"""
         if self.conn:
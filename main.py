@@ -7,6 +7,7 @@
 import yaml
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
@@ -194,55 +195,64 @@ class CryptoSentimentMonitor:
         self.logger.info(f"开始收集数据: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         self.logger.info("="*60)
         
-        # 获取恐慌指数
-        fear_greed = self.sentiment_analyzer.get_fear_greed_index()
-        if fear_greed:
-            self.logger.info(f"恐慌指数: {fear_greed['value']} ({fear_greed['classification']})")
-        else:
-            self.logger.warning("⚠️ 无法获取恐慌指数")
-        
-        data = {
-            'timestamp': datetime.now(),
-            'fear_greed': fear_greed,
-            'coins': {}
-        }
-        
-        # 收集每个币种数据
-        for symbol in self.enabled_coins:
-            self.logger.info(f"收集 {symbol} 数据...")
+        # 恐慌指数与交易所数据来自不同服务，后台线程并行获取
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            fear_greed_future = pool.submit(self.sentiment_analyzer.get_fear_greed_index)
             
-            try:
-                price = self.exchange.get_spot_price(symbol)
-                funding = self.exchange.get_funding_rate(symbol)
-                longshort = self.exchange.get_longshort_ratio(symbol)
-                
-                data['coins'][symbol] = {
-                    'price': price,
-                    'funding_rate': funding,
-                    'longshort': longshort
-                }
+            data = {
+                'timestamp': datetime.now(),
+                'fear_greed': None,
+                'coins': {}
+            }
+            
+            # 收集每个币种数据
+            for symbol in self.enabled_coins:
+                self.logger.info(f"收集 {symbol} 数据...")
                 
-                if price:
-                    self.logger.info(f"  价格: {format_price(price)}")
-                if funding is not None:
-                    self.logger.info(f"  资金费率: {format_percentage(funding)}")
-                if longshort:
-                    self.logger.info(f"  多空比: {longshort['ratio']}")
+                try:
+                    price = self.exchange.get_spot_price(symbol)
+                    funding = self.exchange.get_funding_rate(symbol)
+                    longshort = self.exchange.get_longshort_ratio(symbol)
+                    
+                    data['coins'][symbol] = {
+                        'price': price,
+                        'funding_rate': funding,
+                        'longshort': longshort
+                    }
+                    
+                    if price:
+                        self.logger.info(f"  价格: {format_price(price)}")
+                    if funding is not None:
+                        self.logger.info(f"  资金费率: {format_percentage(funding)}")
+                    if longshort:
+                        self.logger.info(f"  多空比: {longshort['ratio']}")
+                    
+                    time.sleep(0.5)  # 避免API限流
                 
-                time.sleep(0.5)  # 避免API限流
+                except Exception as e:
+                    self.logger.error(f"  ❌ 获取{symbol}数据失败: {e}")
+                    data['coins'][symbol] = {
+                        'price': None,
+                        'funding_rate': None,
+                        'longshort': None
+                    }
             
-            except Exception as e:
-                self.logger.error(f"  ❌ 获取{symbol}数据失败: {e}")
-                data['coins'][symbol] = {
-                    'price': None,
-                    'funding_rate': None,
-                    'longshort': None
-                }
+            fear_greed = fear_greed_future.result()
+        
+        data['fear_greed'] = fear_greed
+        if fear_greed:
+            self.logger.info(f"恐慌指数: {fear_greed['value']} ({fear_greed['classification']})")
+        else:
+            self.logger.warning("⚠️ 无法获取恐慌指数")
         
         # 保存到数据库
         try:
-            self.db.save_market_data(data)
+            saved_ts = self.db.save_market_data(data)
             self.logger.info("✅ 数据已保存到数据库")
+            if saved_ts is not None:
+                if fear_greed:
+                    self.signal_generator.record_fear_greed(saved_ts, fear_greed['value'])
+                self.signal_generator.record_funding(saved_ts, data['coins'])
         except Exception as e:
             self.logger.error(f"❌ 保存数据失败: {e}")
         
@@ -538,6 +548,8 @@ class CryptoSentimentMonitor:
                 self.logger.info("\n✋ 收到停止信号")
                 if self.notifier:
                     self.notifier.send("🛑 <b>监控系统已停止</b>")
+                # 先停止信号线程，再关闭其使用的数据库连接
+                self.signal_generator.close()
                 self.db.close()
                 self.logger.info("👋 系统已关闭")
                 break
@@ -2,6 +2,6 @@
 工具模块
 """
 
-from .helpers import format_price, format_percentage
+from .helpers import format_price, format_percentage, create_http_session, DEFAULT_TIMEOUT, RateLimiter
 
-__all__ = ['format_price', 'format_percentage']
\ No newline at end of file
+__all__ = ['format_price', 'format_percentage', 'create_http_session', 'DEFAULT_TIMEOUT', 'RateLimiter']
\ No newline at end of file
@@ -2,6 +2,16 @@
 辅助工具函数
 """
 
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# (连接超时, 读取超时)，连接阶段失败应尽快放弃
+DEFAULT_TIMEOUT = (5, 30)
+
 def format_price(price: float, decimals: int = 2) -> str:
     """
     格式化价格
@@ -28,4 +38,46 @@ def format_percentage(value: float, decimals: int = 2) -> str:
         return "N/A"
     
     sign = "+" if value > 0 else ""
-    return f"{sign}{value:.{decimals}f}%"
\ No newline at end of file
+    return f"{sign}{value:.{decimals}f}%"
+
+def create_http_session(retries: int = 2, backoff_factor: float = 0.3,
+                        pool_maxsize: int = 8) -> requests.Session:
+    """
+    创建带连接池和传输层重试的 HTTP 会话
+    :param retries: 连接错误 / 502 / 503 / 504 的自动重试次数
+    :param backoff_factor: 重试退避系数
+    :param pool_maxsize: 每个主机保持的最大连接数
+    :return: requests.Session
+    """
+    session = requests.Session()
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(502, 503, 504),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class RateLimiter:
+    """线程安全的请求限频器：相邻两次放行至少间隔 1/rate 秒"""
+    
+    def __init__(self, rate: float):
+        """
+        :param rate: 每秒允许的请求数
+        """
+        self._interval = 1.0 / rate
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+    
+    def wait(self):
+        """阻塞到下一个可用时间槽 (只在锁内预约时间槽，等待时不占锁)"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self._interval
+        if slot > now:
+            time.sleep(slot - now)